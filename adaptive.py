@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# Adaptive batch size and in-flight request count for the send path
+#
+# AIMD (additive increase, multiplicative decrease), as in TCP congestion
+# control: after a full round of fast, successful posts, grow the batch size
+# and the number of concurrent posts by a fixed step; on a 429/503, an error,
+# or a post slower than the latency target, halve them, at most once per
+# decrease_interval. A 413 (payload too large) halves only the batch size.
+# Both always stay within the configured bounds.
+#
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+from future.standard_library import install_aliases
+install_aliases()
+from builtins import *
+
+from collections import deque
+import threading
+import time
+
+
+class AdaptiveController(object):
+    _OVERLOAD_STATUSES = (429, 503)
+
+    def __init__(self, latency_target=0.5, min_batch_size=1, max_batch_size=100,
+        min_in_flight=1, max_in_flight=8, batch_step=5, in_flight_step=1,
+        decrease_factor=0.5, decrease_interval=1.0, ewma_alpha=0.2, history=100):
+        self.latency_target = latency_target
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.min_in_flight = min_in_flight
+        self.max_in_flight = max_in_flight
+        self.batch_step = batch_step
+        self.in_flight_step = in_flight_step
+        self.decrease_factor = decrease_factor
+        self.decrease_interval = decrease_interval
+        self.ewma_alpha = ewma_alpha
+
+        self.batch_size = min_batch_size
+        self.in_flight = min_in_flight
+        self.active = 0
+        self.latency = None             # EWMA of round-trip seconds (reported only)
+        self.posts = 0
+        self.errors = 0
+        self.client_errors = 0          # 4xx other than 413/429; no decision made
+        self.too_large = 0              # 413s; batch size is cut
+        self.overloads = 0
+        self.slow = 0
+        self.increases = 0
+        self.decreases = 0
+        self.decisions = deque(maxlen=history)
+
+        self._round_successes = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    ## In-flight slots: a sender calls acquire() before each post and
+    ## release() after it.
+    def acquire(self, timeout=None):
+        with self._cond:
+            deadline = None if timeout is None else time.time() + timeout
+            while self.active >= self.in_flight:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def record(self, latency, status):
+        """Feed back one post: its round-trip seconds and HTTP status
+        (None for a connection error or timeout)."""
+        with self._cond:
+            self.posts += 1
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.ewma_alpha * (latency - self.latency)
+
+            if status is None or status >= 500 and status not in self._OVERLOAD_STATUSES:
+                self.errors += 1
+                self._decrease('error', status, latency)
+            elif status in self._OVERLOAD_STATUSES:
+                self.overloads += 1
+                self._decrease('overload', status, latency)
+            elif status == 413:
+                self.too_large += 1
+                self._decrease('too_large', status, latency, in_flight=False)
+            elif status >= 400:
+                self.client_errors += 1
+            elif latency > self.latency_target:
+                self.slow += 1
+                self._decrease('slow', status, latency)
+            elif status < 300:
+                self._round_successes += 1
+                if self._round_successes >= self.in_flight:
+                    self._increase(status, latency)
+
+    def _increase(self, status, latency):
+        self._round_successes = 0
+        batch_size = min(self.max_batch_size, self.batch_size + self.batch_step)
+        in_flight = min(self.max_in_flight, self.in_flight + self.in_flight_step)
+        if (batch_size, in_flight) != (self.batch_size, self.in_flight):
+            self.increases += 1
+            self._decide('increase', status, latency, batch_size, in_flight)
+            self._cond.notify_all()
+
+    def _decrease(self, reason, status, latency, in_flight=True):
+        self._round_successes = 0
+        ## posts already in flight report the same congestion; cut at most
+        ## once per decrease_interval
+        now = time.time()
+        if now - self._last_decrease < self.decrease_interval:
+            return
+        self._last_decrease = now
+        batch_size = max(self.min_batch_size, int(self.batch_size * self.decrease_factor))
+        if in_flight:
+            in_flight = max(self.min_in_flight, int(self.in_flight * self.decrease_factor))
+        else:
+            in_flight = self.in_flight
+        self.decreases += 1
+        self._decide(reason, status, latency, batch_size, in_flight)
+
+    def _decide(self, reason, status, latency, batch_size, in_flight):
+        self.decisions.append({
+            'time': time.time(),
+            'reason': reason,
+            'status': status,
+            'latency': latency,
+            'batch_size': batch_size,
+            'in_flight': in_flight
+        })
+        self.batch_size = batch_size
+        self.in_flight = in_flight
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                'batch_size': self.batch_size,
+                'in_flight': self.in_flight,
+                'active': self.active,
+                'latency': self.latency,
+                'latency_target': self.latency_target,
+                'posts': self.posts,
+                'errors': self.errors,
+                'client_errors': self.client_errors,
+                'too_large': self.too_large,
+                'overloads': self.overloads,
+                'slow': self.slow,
+                'increases': self.increases,
+                'decreases': self.decreases,
+                'last_decision': self.decisions[-1] if self.decisions else None
+            }
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# Time pre-send validation per event, over a mix of valid and invalid
+# events. Exits non-zero if it is slower than MAX_US_PER_EVENT.
+
+from __future__ import print_function
+import sys
+import timeit
+
+import caliper.events as events
+import caliper.profiles as profiles
+from builder import *
+from validation import build_validator
+
+N_EVENTS = 1000
+REPEAT = 5
+MAX_US_PER_EVENT = 5.0
+
+builder = Builder()
+
+section = Section('Math 7', '104', '7177', '4', '1617', 'FY')
+course_entity = builder.build_course(section)
+section_entity = builder.build_section(course_entity, section.section_number)
+assessment = Assessment('44001', 'Read George Washington', 2, 2, 100.0)
+assessment_entity = builder.build_assessment(section_entity, assessment)
+item = AssessmentItem('44001.1', 'Washington Quiz Question 1', 2, 2, 10.0)
+assessment_item_entity = builder.build_assessment_item(assessment_entity, item)
+student_actor = builder.build_student('123456', '10736344450')
+
+item_attempt_entity = builder.build_assessment_item_attempt(
+    assessment_item_entity, student_actor, '11', 1)
+response_entity = builder.build_multiple_choice_response(
+    item_attempt_entity, student_actor, AssessmentItemResponse('44001.1.X', ['B']))
+item_event = events.AssessmentItemEvent(
+    actor = student_actor,
+    action = profiles.AssessmentItemProfile.Actions['COMPLETED'],
+    isTimeDependent = False,
+    event_object = assessment_item_entity,
+    generated = response_entity,
+    eventTime = builder.now())
+
+assessment_attempt_entity = builder.build_assessment_attempt(
+    assessment_entity, student_actor, '1', 1)
+result_entity = builder.build_assessment_result(
+    assessment_attempt_entity, student_actor, student_actor,
+    AssessmentResult('Good job', 95.0))
+outcome_event = events.OutcomeEvent(
+    actor = student_actor,
+    action = profiles.OutcomeProfile.Actions['GRADED'],
+    event_object = assessment_attempt_entity,
+    generated = result_entity,
+    eventTime = builder.now())
+
+## invalid: a list for a multiple choice response, a score above maxScore
+bad_item_event = events.AssessmentItemEvent(
+    actor = student_actor,
+    action = profiles.AssessmentItemProfile.Actions['COMPLETED'],
+    isTimeDependent = False,
+    event_object = assessment_item_entity,
+    generated = builder.build_multiple_choice_response(
+        item_attempt_entity, student_actor, AssessmentItemResponse('44001.1.Z', ['B'])),
+    eventTime = builder.now())
+bad_item_event.generated.values = ['B', 'C']
+bad_result_entity = builder.build_assessment_result(
+    assessment_attempt_entity, student_actor, student_actor,
+    AssessmentResult('Extra credit?', 120.0))
+bad_outcome_event = events.OutcomeEvent(
+    actor = student_actor,
+    action = profiles.OutcomeProfile.Actions['GRADED'],
+    event_object = assessment_attempt_entity,
+    generated = bad_result_entity,
+    eventTime = builder.now())
+
+batch = [item_event, outcome_event, bad_item_event, bad_outcome_event] * (N_EVENTS // 4)
+
+start = timeit.default_timer()
+validator = build_validator()
+print('compile: {0:.1f} ms'.format((timeit.default_timer() - start) * 1000))
+
+best = min(timeit.repeat(lambda: validator.validate_batch(batch),
+    number=1, repeat=REPEAT))
+valid, invalid = validator.validate_batch(batch)
+us_per_event = best * 1e6 / len(batch)
+print('validate: {0:.2f} us/event ({1:d} valid, {2:d} invalid)'.format(
+    us_per_event, len(valid), len(invalid)))
+if us_per_event > MAX_US_PER_EVENT:
+    print('FAIL: over {0:.1f} us/event'.format(MAX_US_PER_EVENT))
+    sys.exit(1)
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+# Fan-out delivery of Caliper events to several endpoints
+#
+# Each event is serialized exactly once. The resulting (immutable) bytes are
+# shared by every endpoint's queue, and each endpoint assembles its own
+# envelopes from them, so the cost of delivering to N endpoints is N HTTP
+# posts, not N serializations.
+#
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+from future.standard_library import install_aliases
+install_aliases()
+from builtins import *
+
+from datetime import datetime
+import json
+import queue
+import threading
+import time
+
+import requests
+
+from adaptive import AdaptiveController
+
+
+class EndpointMetrics(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.posts = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.last_status = None
+
+    def incr(self, name, n=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def posted(self, status):
+        with self._lock:
+            self.posts += 1
+            self.last_status = status
+
+    def delivered(self, count, lag):
+        with self._lock:
+            self.sent += count
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'enqueued': self.enqueued,
+                'dropped': self.dropped,
+                'sent': self.sent,
+                'failed': self.failed,
+                'retries': self.retries,
+                'posts': self.posts,
+                'last_lag': self.last_lag,
+                'max_lag': self.max_lag,
+                'last_status': self.last_status
+            }
+
+
+class Endpoint(object):
+    """One delivery target: its own queue, worker, retry state and metrics.
+
+    config is a caliper.HttpOptions, the same object you would pass to
+    caliper.build_sensor_from_config. With an adaptive.AdaptiveController,
+    the batch size and number of concurrent posts follow the controller;
+    without one, batch_size is fixed and posts are sent one at a time.
+    """
+    _RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, name, config, batch_size=10, max_queue=10000,
+        max_retries=5, retry_backoff=0.5, max_backoff=30.0, controller=None):
+        self.name = name
+        self.host = config.HOST
+        auth_scheme = getattr(config, 'AUTH_SCHEME', None)
+        if auth_scheme:
+            authorization = '{0!s} {1!s}'.format(auth_scheme, config.API_KEY)
+        else:
+            authorization = '{0!s}'.format(config.API_KEY)
+        self.headers = {
+            'Authorization': authorization,
+            'Content-Type': 'application/json'
+        }
+        self.timeout = config.SOCKET_TIMEOUT / 1000.0
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.controller = controller
+        self.metrics = EndpointMetrics()
+        self._queue = queue.Queue(max_queue)
+        self._session = requests.Session()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._in_flight = {}            # id(batch) -> oldest enqueued_at
+        self._in_flight_lock = threading.Lock()
+        self.sensor_id = None
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    @property
+    def oldest_pending_age(self):
+        """Seconds since the oldest event not yet delivered or given up on
+        was enqueued (0.0 if there is none). Unlike last_lag, this keeps
+        growing while the endpoint is down."""
+        with self._in_flight_lock:
+            pending = list(self._in_flight.values())
+        q = self._queue
+        with q.mutex:
+            if q.queue:
+                pending.append(q.queue[0][0])
+        if not pending:
+            return 0.0
+        return max(0.0, time.time() - min(pending))
+
+    def start(self, sensor_id):
+        self.sensor_id = sensor_id
+        if not self._threads:
+            self._stopping.clear()
+            workers = 1 if self.controller is None else self.controller.max_in_flight
+            for i in range(workers):
+                thread = threading.Thread(target=self._run,
+                    name='caliper-fanout-{0!s}-{1:d}'.format(self.name, i))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+    def request_stop(self):
+        """Ask the workers to exit without waiting for them."""
+        self._stopping.set()
+
+    def stop(self, timeout=None):
+        """Stop the workers, waiting at most timeout seconds for them.
+        Events still queued are counted as dropped."""
+        deadline = None if timeout is None else time.time() + timeout
+        self.request_stop()
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.time()))
+        self._threads = []
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self.metrics.incr('dropped')
+            self._queue.task_done()
+
+    def put_all(self, payloads, enqueued_at):
+        ## never block the caller: a full queue means this endpoint is
+        ## behind, and the other endpoints must not wait for it
+        for payload in payloads:
+            try:
+                self._queue.put_nowait((enqueued_at, payload))
+                self.metrics.incr('enqueued')
+            except queue.Full:
+                self.metrics.incr('dropped')
+
+    def join(self, deadline=None):
+        """Wait until every queued event has been delivered or failed, or
+        until deadline (a time.time() value). Returns True if drained."""
+        q = self._queue
+        with q.all_tasks_done:
+            while q.unfinished_tasks:
+                if deadline is None:
+                    q.all_tasks_done.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                    q.all_tasks_done.wait(remaining)
+        return True
+
+    def envelope(self, payloads):
+        send_time = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')[:-4] + 'Z'
+        return b''.join([
+            b'{"sensor": ', json.dumps(self.sensor_id).encode('utf-8'),
+            b', "sendTime": ', json.dumps(send_time).encode('utf-8'),
+            b', "data": [', b', '.join(payloads), b']}'])
+
+    def _take_batch(self, size):
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        while len(batch) < size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        controller = self.controller
+        while not self._stopping.is_set():
+            if controller is None:
+                self._send_batch(self.batch_size)
+            elif controller.acquire(timeout=0.1):
+                try:
+                    self._send_batch(controller.batch_size)
+                finally:
+                    controller.release()
+
+    def _send_batch(self, size):
+        batch = self._take_batch(size)
+        if not batch:
+            return
+        with self._in_flight_lock:
+            self._in_flight[id(batch)] = min(enqueued_at for enqueued_at, _ in batch)
+        try:
+            self._deliver(batch)
+        finally:
+            with self._in_flight_lock:
+                del self._in_flight[id(batch)]
+            for _ in batch:
+                self._queue.task_done()
+
+    def _post(self, body):
+        start = time.time()
+        try:
+            status = self._session.post(self.host, data=body, headers=self.headers,
+                timeout=self.timeout).status_code
+        except requests.RequestException:
+            status = None
+        if self.controller is not None:
+            self.controller.record(time.time() - start, status)
+        return status
+
+    def _deliver(self, batch):
+        body = self.envelope([payload for _, payload in batch])
+        attempt = 0
+        while True:
+            status = self._post(body)
+            self.metrics.posted(status)
+            if status is not None and status < 300:
+                oldest = min(enqueued_at for enqueued_at, _ in batch)
+                self.metrics.delivered(len(batch), time.time() - oldest)
+                return True
+            retryable = status is None or status in self._RETRY_STATUSES
+            if not retryable or attempt >= self.max_retries or self._stopping.is_set():
+                self.metrics.incr('failed', len(batch))
+                return False
+            attempt += 1
+            self.metrics.incr('retries')
+            ## wakes early, and gives up, if the endpoint is stopped
+            if self._stopping.wait(min(self.max_backoff, self.retry_backoff * (2 ** (attempt - 1)))):
+                self.metrics.incr('failed', len(batch))
+                return False
+
+
+class FanoutSensor(object):
+    """A sensor-like object whose send() delivers to several endpoints.
+
+    Events are serialized once with as_json(); every endpoint gets the same
+    bytes, queued independently, so a slow endpoint only delays itself.
+    If a validation.Validator is given, invalid events are written to
+    dead_letter (if any) and never queued; their count is reported as
+    'rejected' in each endpoint's metrics().
+    """
+
+    def __init__(self, sensor_id, endpoints, validator=None, dead_letter=None):
+        self.id = sensor_id
+        self.endpoints = list(endpoints)
+        self.validator = validator
+        self.dead_letter = dead_letter
+        self.rejected = 0
+        self._rejected_lock = threading.Lock()
+        for endpoint in self.endpoints:
+            endpoint.start(self.id)
+
+    def serialize(self, event):
+        return event.as_json().encode('utf-8')
+
+    def send(self, events):
+        if not isinstance(events, (list, tuple)):
+            events = [events]
+        if self.validator is not None:
+            events, invalid = self.validator.validate_batch(events, self.dead_letter)
+            with self._rejected_lock:
+                self.rejected += len(invalid)
+        payloads = [self.serialize(event) for event in events]
+        enqueued_at = time.time()
+        for endpoint in self.endpoints:
+            endpoint.put_all(payloads, enqueued_at)
+        return len(payloads)
+
+    def flush(self, timeout=None):
+        """Wait for every endpoint's queue to drain, sharing one deadline.
+        Returns True if all endpoints drained in time."""
+        deadline = None if timeout is None else time.time() + timeout
+        drained = True
+        for endpoint in self.endpoints:
+            drained = endpoint.join(deadline) and drained
+        return drained
+
+    def close(self, timeout=None):
+        """Flush, then stop every endpoint. timeout bounds the whole call;
+        whatever is still queued when it runs out is counted as dropped."""
+        deadline = None if timeout is None else time.time() + timeout
+        self.flush(timeout)
+        for endpoint in self.endpoints:
+            ## stop them all first so retry loops exit together
+            endpoint.request_stop()
+        for endpoint in self.endpoints:
+            endpoint.stop(None if deadline is None else max(0.0, deadline - time.time()))
+
+    def metrics(self):
+        result = {}
+        for endpoint in self.endpoints:
+            snapshot = endpoint.metrics.snapshot()
+            snapshot['queue_depth'] = endpoint.queue_depth
+            snapshot['oldest_pending_age'] = endpoint.oldest_pending_age
+            snapshot['rejected'] = self.rejected
+            if endpoint.controller is not None:
+                snapshot['adaptive'] = endpoint.controller.snapshot()
+            result[endpoint.name] = snapshot
+        return result
+
+
+def build_fanout_sensor(sensor_id, configs, validator=None, dead_letter=None,
+    adaptive=None, **endpoint_options):
+    """configs is a dict of endpoint name -> caliper.HttpOptions.
+
+    adaptive, if given, is a dict of AdaptiveController options; each
+    endpoint gets its own controller built from it.
+    """
+    endpoints = []
+    for name, config in sorted(configs.items()):
+        controller = None if adaptive is None else AdaptiveController(**adaptive)
+        endpoints.append(Endpoint(name, config, controller=controller, **endpoint_options))
+    return FanoutSensor(sensor_id, endpoints, validator, dead_letter)
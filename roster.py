@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+# In-memory roster index built from a PowerSchool roster export
+#
+# Load the export once, then look up prebuilt Caliper entities for a score
+# row with dict lookups instead of searching lists or calling the SIS.
+#
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+from future.standard_library import install_aliases
+install_aliases()
+from builtins import *
+
+import csv
+
+from builder import Section
+
+
+### Roster export columns, one row per enrollment:
+###
+### local_id, ssid, year_abbr, term_abbr, school_id, course_number,
+### course_name, section_number, and optionally group_id, group_name and
+### session_id (defaults below are used when they are missing or empty).
+
+_DEFAULT_GROUP_ID = '1'
+_DEFAULT_GROUP_NAME = 'All Students'
+
+
+def section_key(year_abbr, school_id, course_number, section_number):
+    return (year_abbr, school_id, course_number, section_number)
+
+
+class RosterIndex(object):
+    def __init__(self, builder):
+        self.builder = builder
+        self.students_by_local_id = {}
+        self.students_by_ssid = {}
+        self.sections = {}              # section key -> section entity
+        self.groups = {}                # (section key, group_id) -> group entity
+        self.sessions = {}              # local_id -> session entity
+        self.enrollments = {}           # (local_id, section key) -> membership
+        self.enrollment_groups = {}     # (local_id, section key) -> group_id
+        self.enrollments_by_student = {}    # local_id -> set of section keys
+        self.enrollments_by_section = {}    # section key -> set of local_ids
+        self._courses = {}
+        self._session_ids = {}
+
+    @classmethod
+    def from_csv(cls, builder, path):
+        index = cls(builder)
+        ## newline='' for quoted fields with line breaks; utf-8-sig drops the
+        ## BOM that SIS/Excel exports often start with
+        with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+            for row in csv.DictReader(f):
+                index.add_enrollment(row)
+        return index
+
+    def __len__(self):
+        return len(self.enrollments)
+
+    ## Lookups ##
+    def student(self, local_id):
+        return self.students_by_local_id.get(local_id)
+
+    def student_by_ssid(self, ssid):
+        return self.students_by_ssid.get(ssid)
+
+    def section(self, year_abbr, school_id, course_number, section_number):
+        return self.sections.get(section_key(year_abbr, school_id, course_number, section_number))
+
+    def group(self, key, group_id=_DEFAULT_GROUP_ID):
+        return self.groups.get((key, group_id))
+
+    def enrollment_group(self, local_id, key):
+        group_id = self.enrollment_groups.get((local_id, key))
+        if group_id is None:
+            return None
+        return self.groups[(key, group_id)]
+
+    def session(self, local_id):
+        return self.sessions.get(local_id)
+
+    def enrollment(self, local_id, key):
+        return self.enrollments.get((local_id, key))
+
+    def enrollment_by_ssid(self, ssid, key):
+        student_entity = self.students_by_ssid.get(ssid)
+        if student_entity is None:
+            return None
+        return self.enrollments.get((student_entity.extensions['local_id'], key))
+
+    def sections_for_student(self, local_id):
+        return [self.sections[key] for key in self.enrollments_by_student.get(local_id, ())]
+
+    def students_in_section(self, key):
+        return [self.students_by_local_id[local_id]
+            for local_id in self.enrollments_by_section.get(key, ())]
+
+    def learning_context(self, local_id, key, tool_id, tool_name):
+        membership = self.enrollment(local_id, key)
+        if membership is None:
+            return None
+        return self.builder.build_learning_context(self.enrollment_group(local_id, key),
+            membership, self.sessions.get(local_id), tool_id, tool_name)
+
+    ## Incremental updates ##
+    def add_enrollment(self, row):
+        """Add or refresh one enrollment from a roster export row (a dict).
+
+        Non-empty ssid, session_id, group_id and group_name values replace
+        what is already indexed for the student, session, enrollment and
+        group; entities that embed a replaced one are rebuilt. Empty values
+        leave the indexed data alone.
+        """
+        local_id = row['local_id']
+        key = section_key(row['year_abbr'], row['school_id'],
+            row['course_number'], row['section_number'])
+        section_entity = self.sections.get(key)
+        if section_entity is None:
+            section_entity = self._add_section(key, row)
+        student_entity = self._add_student(local_id, row.get('ssid') or None,
+            row.get('session_id') or None)
+        enrollment_key = (local_id, key)
+        if enrollment_key not in self.enrollments:
+            self.enrollments[enrollment_key] = self.builder.build_section_enrollment(
+                section_entity, student_entity)
+            self.enrollments_by_student.setdefault(local_id, set()).add(key)
+            self.enrollments_by_section.setdefault(key, set()).add(local_id)
+        group_id = (row.get('group_id') or self.enrollment_groups.get(enrollment_key)
+            or _DEFAULT_GROUP_ID)
+        self._add_group(key, group_id, row.get('group_name'))
+        self.enrollment_groups[enrollment_key] = group_id
+        return self.enrollments[enrollment_key]
+
+    def drop_enrollment(self, local_id, key):
+        """Remove one enrollment. Students and sections are kept, since
+        other enrollments (or historical events) may still refer to them.
+        Returns the dropped membership entity, or None."""
+        membership = self.enrollments.pop((local_id, key), None)
+        self.enrollment_groups.pop((local_id, key), None)
+        if membership is not None:
+            self.enrollments_by_student[local_id].discard(key)
+            self.enrollments_by_section[key].discard(local_id)
+        return membership
+
+    def _add_student(self, local_id, ssid, session_id):
+        student_entity = self.students_by_local_id.get(local_id)
+        rebuilt = False
+        if student_entity is None:
+            rebuilt = True
+        else:
+            old_ssid = student_entity.extensions['ssid']
+            if ssid and ssid != old_ssid:
+                if old_ssid and self.students_by_ssid.get(old_ssid) is student_entity:
+                    del self.students_by_ssid[old_ssid]
+                rebuilt = True
+            else:
+                ssid = old_ssid
+        if rebuilt:
+            student_entity = self.builder.build_student(local_id, ssid)
+            self.students_by_local_id[local_id] = student_entity
+            if ssid:
+                self.students_by_ssid[ssid] = student_entity
+            ## memberships embed the student entity
+            for key in self.enrollments_by_student.get(local_id, ()):
+                self.enrollments[(local_id, key)] = self.builder.build_section_enrollment(
+                    self.sections[key], student_entity)
+
+        old_session_id = self._session_ids.get(local_id)
+        session_id = session_id or old_session_id
+        if session_id and (rebuilt or session_id != old_session_id):
+            self.sessions[local_id] = self.builder.build_federated_session(
+                student_entity, session_id)
+            self._session_ids[local_id] = session_id
+        return student_entity
+
+    def _add_section(self, key, row):
+        year_abbr, school_id, course_number, section_number = key
+        section = Section(row['course_name'], school_id, course_number,
+            section_number, year_abbr, row['term_abbr'])
+        course_key = (year_abbr, school_id, course_number)
+        course_entity = self._courses.get(course_key)
+        if course_entity is None:
+            course_entity = self.builder.build_course(section)
+            self._courses[course_key] = course_entity
+        section_entity = self.builder.build_section(course_entity, section_number)
+        self.sections[key] = section_entity
+        return section_entity
+
+    def _add_group(self, key, group_id, group_name):
+        group_entity = self.groups.get((key, group_id))
+        if group_entity is None or (group_name and group_name != group_entity.name):
+            group_entity = self.builder.build_section_group(self.sections[key],
+                group_id, group_name or _DEFAULT_GROUP_NAME)
+            self.groups[(key, group_id)] = group_entity
+        return group_entity
@@ -0,0 +1,101 @@
+from adaptive import AdaptiveController
+
+
+def controller(**options):
+    defaults = dict(latency_target=0.1, min_batch_size=1, max_batch_size=20,
+        min_in_flight=1, max_in_flight=4, batch_step=5, in_flight_step=1,
+        decrease_interval=0)
+    defaults.update(options)
+    return AdaptiveController(**defaults)
+
+
+def succeed(c, n, latency=0.01):
+    for _ in range(n):
+        c.record(latency, 200)
+
+
+def test_additive_increase_once_per_round():
+    c = controller()
+    succeed(c, 1)
+    assert (c.batch_size, c.in_flight) == (6, 2)
+    ## a round is now two posts
+    succeed(c, 1)
+    assert (c.batch_size, c.in_flight) == (6, 2)
+    succeed(c, 1)
+    assert (c.batch_size, c.in_flight) == (11, 3)
+
+
+def test_increase_stops_at_upper_bounds():
+    c = controller()
+    succeed(c, 100)
+    assert (c.batch_size, c.in_flight) == (20, 4)
+    increases = c.increases
+    succeed(c, 10)
+    assert c.increases == increases
+
+
+def test_multiplicative_decrease_on_overload_and_error():
+    c = controller()
+    succeed(c, 100)
+    c.record(0.01, 429)
+    assert (c.batch_size, c.in_flight) == (10, 2)
+    c.record(0.01, None)
+    assert (c.batch_size, c.in_flight) == (5, 1)
+    c.record(0.01, 503)
+    c.record(0.01, 500)
+    c.record(0.01, 503)
+    assert (c.batch_size, c.in_flight) == (1, 1)
+    snapshot = c.snapshot()
+    assert (snapshot['overloads'], snapshot['errors']) == (3, 2)
+    assert snapshot['last_decision']['reason'] == 'overload'
+
+
+def test_decreases_are_debounced():
+    c = controller(decrease_interval=60)
+    succeed(c, 100)
+    for _ in range(3):
+        c.record(0.01, 503)
+    assert (c.batch_size, c.in_flight) == (10, 2)
+    assert (c.decreases, c.overloads) == (1, 3)
+
+
+def test_slow_is_judged_per_post_not_by_average():
+    c = controller()
+    succeed(c, 100)
+    c.record(5.0, 200)
+    assert c.slow == 1
+    assert (c.batch_size, c.in_flight) == (10, 2)
+    ## the average is still high, but fast posts grow the window again
+    succeed(c, 2)
+    assert c.slow == 1
+    assert c.latency > c.latency_target
+    assert (c.batch_size, c.in_flight) == (15, 3)
+
+
+def test_client_errors_are_counted_without_a_decision():
+    c = controller()
+    for status in (400, 401, 404):
+        c.record(0.01, status)
+    snapshot = c.snapshot()
+    assert snapshot['client_errors'] == 3
+    assert (snapshot['increases'], snapshot['decreases']) == (0, 0)
+
+
+def test_payload_too_large_cuts_batch_size_only():
+    c = controller()
+    succeed(c, 100)
+    c.record(0.01, 413)
+    assert (c.batch_size, c.in_flight) == (10, 4)
+    c.record(0.01, 413)
+    assert (c.batch_size, c.in_flight) == (5, 4)
+    snapshot = c.snapshot()
+    assert (snapshot['too_large'], snapshot['client_errors']) == (2, 0)
+    assert snapshot['last_decision']['reason'] == 'too_large'
+
+
+def test_in_flight_slots():
+    c = controller()
+    assert c.acquire(timeout=0)
+    assert not c.acquire(timeout=0.01)
+    c.release()
+    assert c.acquire(timeout=0)
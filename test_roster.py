@@ -0,0 +1,122 @@
+import io
+
+import pytest
+
+## roster imports builder, which needs the caliper library
+pytest.importorskip('caliper')
+
+from roster import RosterIndex, section_key
+
+
+class Entity(object):
+    def __init__(self, **props):
+        self.__dict__.update(props)
+
+
+class FakeBuilder(object):
+    """Builds plain objects instead of caliper entities."""
+
+    def build_student(self, student_id, ssid):
+        return Entity(id='s/' + student_id,
+            extensions={'local_id': student_id, 'ssid': ssid})
+
+    def build_course(self, section):
+        return Entity(id='c/' + section.course_number, name=section.course_name)
+
+    def build_section(self, course_entity, section_id):
+        return Entity(id=course_entity.id + '/' + section_id, name=course_entity.name)
+
+    def build_section_group(self, section_entity, group_id, group_name):
+        return Entity(id=section_entity.id + '/g' + group_id, name=group_name)
+
+    def build_section_enrollment(self, section_entity, student_entity):
+        return Entity(member=student_entity, organization=section_entity)
+
+    def build_federated_session(self, actor, session_id):
+        return Entity(id='session/' + session_id, actor=actor)
+
+    def build_learning_context(self, group, membership, session, tool_id, tool_name):
+        return Entity(group=group, membership=membership, session=session)
+
+
+KEY = section_key('1617', '104', '7177', '4')
+
+
+def row(local_id, **values):
+    r = {'local_id': local_id, 'ssid': '', 'year_abbr': '1617', 'term_abbr': 'FY',
+        'school_id': '104', 'course_number': '7177', 'course_name': 'Math 7',
+        'section_number': '4', 'group_id': '', 'group_name': '', 'session_id': ''}
+    r.update(values)
+    return r
+
+
+def test_lookups():
+    roster = RosterIndex(FakeBuilder())
+    roster.add_enrollment(row('1', ssid='111', session_id='9'))
+    roster.add_enrollment(row('2', ssid='222'))
+    assert len(roster) == 2
+    student = roster.student('1')
+    assert roster.student_by_ssid('111') is student
+    assert roster.section('1617', '104', '7177', '4').id == 'c/7177/4'
+    assert roster.enrollment('1', KEY).member is student
+    assert roster.enrollment_by_ssid('222', KEY).member is roster.student('2')
+    assert sorted(s.id for s in roster.students_in_section(KEY)) == ['s/1', 's/2']
+    context = roster.learning_context('1', KEY, 'tool', 'Tool')
+    assert context.session.id == 'session/9'
+    assert context.group.name == 'All Students'
+
+
+def test_group_comes_from_each_row():
+    roster = RosterIndex(FakeBuilder())
+    roster.add_enrollment(row('1', group_id='A', group_name='Group A'))
+    roster.add_enrollment(row('2', group_id='B', group_name='Group B'))
+    assert roster.learning_context('1', KEY, 't', 'T').group.id.endswith('/gA')
+    assert roster.learning_context('2', KEY, 't', 'T').group.id.endswith('/gB')
+    roster.add_enrollment(row('2', group_id='A'))
+    assert roster.enrollment_group('2', KEY) is roster.group(KEY, 'A')
+
+
+def test_drop_and_re_add():
+    roster = RosterIndex(FakeBuilder())
+    roster.add_enrollment(row('1'))
+    assert roster.drop_enrollment('1', KEY) is not None
+    assert roster.enrollment('1', KEY) is None
+    assert roster.students_in_section(KEY) == []
+    assert roster.learning_context('1', KEY, 't', 'T') is None
+    assert roster.drop_enrollment('1', KEY) is None
+    roster.add_enrollment(row('1'))
+    assert roster.enrollment('1', KEY).member is roster.student('1')
+
+
+def test_re_add_refreshes_ssid_and_session():
+    roster = RosterIndex(FakeBuilder())
+    roster.add_enrollment(row('1'))
+    assert roster.student_by_ssid('111') is None
+    roster.add_enrollment(row('1', ssid='111', session_id='9'))
+    student = roster.student_by_ssid('111')
+    assert student is roster.student('1')
+    assert roster.enrollment('1', KEY).member is student
+    assert roster.session('1').actor is student
+
+    roster.add_enrollment(row('1', ssid='112', session_id='10'))
+    assert roster.student_by_ssid('111') is None
+    assert roster.student_by_ssid('112') is roster.student('1')
+    assert roster.session('1').id == 'session/10'
+
+    ## empty values keep what is indexed
+    roster.add_enrollment(row('1'))
+    assert roster.student('1').extensions['ssid'] == '112'
+    assert roster.session('1').id == 'session/10'
+
+
+def test_from_csv_with_bom_and_quoted_newline(tmp_path):
+    path = str(tmp_path / 'roster.csv')
+    with io.open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        f.write(u'local_id,ssid,year_abbr,term_abbr,school_id,course_number,'
+            u'course_name,section_number,group_name\r\n'
+            u'1,111,1617,FY,104,7177,Math 7,4,"Period 1\nBlue"\r\n'
+            u'2,222,1617,FY,104,7177,Math 7,4,\r\n')
+    roster = RosterIndex.from_csv(FakeBuilder(), path)
+    assert len(roster) == 2
+    assert roster.student_by_ssid('222') is roster.student('2')
+    assert roster.enrollment_group('1', KEY).name == 'Period 1\nBlue'
@@ -0,0 +1,125 @@
+import json
+
+from fanout import FanoutSensor
+from test_fanout import FakeSession, endpoint
+from validation import DeadLetterFile, Validator
+
+
+### Stand-ins named after the caliper classes the rules are keyed on
+
+class Entity(object):
+    def __init__(self, **props):
+        self.id = 'entity/1'
+        self.__dict__.update(props)
+
+    def as_json(self):
+        return json.dumps({'@id': self.id})
+
+class Assessment(Entity): pass
+class AssessmentItem(Entity): pass
+class Attempt(Entity): pass
+class Response(Entity): pass
+class MultipleChoiceResponse(Response): pass
+class MultipleResponseResponse(Response): pass
+class Result(Entity): pass
+
+class Event(Entity):
+    def __init__(self, **props):
+        defaults = dict(actor=Entity(), action='Started', object=Entity(),
+            eventTime='2016-11-01T10:00:00.000Z', generated=None)
+        defaults.update(props)
+        Entity.__init__(self, **defaults)
+
+class AssessmentItemEvent(Event): pass
+class OutcomeEvent(Event): pass
+
+
+ASSESSMENT = Assessment(maxScore=100.0)
+
+
+def response(cls, values):
+    return cls(actor=Entity(), attempt=Attempt(actor=Entity(), assignable=ASSESSMENT),
+        values=values)
+
+
+def result(**props):
+    defaults = dict(actor=Entity(), assignable=ASSESSMENT)
+    defaults.update(props)
+    return Result(**defaults)
+
+
+def test_event_rules_apply_to_subclasses():
+    errors = Validator().errors(AssessmentItemEvent(actor=None, eventTime=None))
+    assert errors == ['missing actor', 'missing eventTime']
+
+
+def test_response_values_types():
+    v = Validator()
+    assert v.errors(AssessmentItemEvent(
+        generated=response(MultipleChoiceResponse, 'B'))) == []
+    assert v.errors(AssessmentItemEvent(
+        generated=response(MultipleChoiceResponse, ['B']))) == \
+        ['generated: values must be a string, got list']
+    assert v.errors(AssessmentItemEvent(
+        generated=response(MultipleResponseResponse, ['B', 'C']))) == []
+    assert v.errors(AssessmentItemEvent(
+        generated=response(MultipleResponseResponse, 'B'))) == \
+        ['generated: values must be a list of strings']
+
+
+def test_score_rules():
+    v = Validator()
+    assert v.errors(OutcomeEvent(generated=result(normalScore=95.0))) == []
+    assert v.errors(OutcomeEvent(generated=result(normalScore=120.0))) == \
+        ['generated: normalScore 120.0 exceeds maxScore 100.0']
+    assert v.errors(OutcomeEvent(generated=result(normalScore=True))) == \
+        ['generated: normalScore must be a number']
+    assert v.errors(OutcomeEvent(generated=result(normalScore=-1))) == \
+        ['generated: normalScore -1 is negative']
+    ## extra credit and curves may go past maxScore
+    assert v.errors(OutcomeEvent(generated=result(normalScore=100.0,
+        extraCreditScore=10.0, totalScore=110.0, curvedTotalScore=115.0))) == []
+    assert v.errors(OutcomeEvent(generated=result(totalScore=False))) == \
+        ['generated: totalScore must be a number']
+
+
+def test_nested_errors_are_prefixed():
+    errors = Validator().errors(OutcomeEvent(object=Attempt(actor=None, assignable=ASSESSMENT),
+        generated=result(actor=None)))
+    assert errors == ['object: missing actor', 'generated: missing actor']
+
+
+def test_rules_are_compiled_once_per_class():
+    v = Validator(classes=[AssessmentItemEvent])
+    checks = v._compiled[AssessmentItemEvent]
+    v.errors(AssessmentItemEvent())
+    assert v._compiled[AssessmentItemEvent] is checks
+
+
+def test_dead_letter_file(tmp_path):
+    path = str(tmp_path / 'dead.jsonl')
+    bad = AssessmentItemEvent(actor=None)
+    valid, invalid = Validator().validate_batch([AssessmentItemEvent(), bad],
+        DeadLetterFile(path))
+    assert len(valid) == 1
+    assert invalid == [(bad, ['missing actor'])]
+    with open(path) as f:
+        lines = [json.loads(line) for line in f]
+    assert lines == [{'errors': ['missing actor'], 'event': {'@id': 'entity/1'}}]
+
+
+def test_sensor_queues_only_valid_events(tmp_path):
+    path = str(tmp_path / 'dead.jsonl')
+    e = endpoint('a', FakeSession(200))
+    sensor = FanoutSensor('sensor-1', [e], Validator(), DeadLetterFile(path))
+    good = AssessmentItemEvent()
+    good.id = 'good'
+    assert sensor.send([good, AssessmentItemEvent(actor=None)]) == 1
+    assert sensor.flush(timeout=5)
+    sensor.close(timeout=1)
+    envelope = json.loads(e._session.bodies[0].decode('utf-8'))
+    assert envelope['data'] == [{'@id': 'good'}]
+    metrics = sensor.metrics()['a']
+    assert (metrics['sent'], metrics['rejected']) == (1, 1)
+    with open(path) as f:
+        assert len(f.readlines()) == 1
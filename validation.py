@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# Pre-send validation of Caliper events and entities
+#
+# The rules below are compiled once (per class) into a flat tuple of small
+# check functions, so validating an event is a dict lookup plus a few
+# attribute reads. Invalid events can be appended to a dead-letter file
+# instead of being queued for a backend that would reject them anyway.
+#
+from __future__ import (absolute_import, division, print_function, unicode_literals)
+from future.standard_library import install_aliases
+install_aliases()
+from builtins import *
+
+import json
+import numbers
+import threading
+
+try:
+    string_types = (str, unicode)
+except NameError:
+    string_types = (str,)
+
+
+### Rule builders: each returns a check(obj) that returns an error string
+### or None.
+
+def required(name):
+    def check(obj):
+        if getattr(obj, name, None) is None:
+            return 'missing {0!s}'.format(name)
+    return check
+
+def is_string(name):
+    def check(obj):
+        value = getattr(obj, name, None)
+        if not isinstance(value, string_types):
+            return '{0!s} must be a string, got {1!s}'.format(name, type(value).__name__)
+    return check
+
+def is_string_list(name):
+    def check(obj):
+        value = getattr(obj, name, None)
+        if not isinstance(value, list) or not all(isinstance(v, string_types) for v in value):
+            return '{0!s} must be a list of strings'.format(name)
+    return check
+
+def non_negative_score(name):
+    def check(obj):
+        score = getattr(obj, name, None)
+        if score is None:
+            return None
+        if isinstance(score, bool) or not isinstance(score, numbers.Number):
+            return '{0!s} must be a number'.format(name)
+        if score < 0:
+            return '{0!s} {1!s} is negative'.format(name, score)
+    return check
+
+def score_in_range(name):
+    is_score = non_negative_score(name)
+    def check(obj):
+        error = is_score(obj)
+        if error:
+            return error
+        score = getattr(obj, name, None)
+        max_score = getattr(getattr(obj, 'assignable', None), 'maxScore', None)
+        if score is not None and isinstance(max_score, numbers.Number) and score > max_score:
+            return '{0!s} {1!s} exceeds maxScore {2!s}'.format(name, score, max_score)
+    return check
+
+
+### Rules by Caliper class name. A class gets the rules of every class in
+### its MRO, so 'Event' rules apply to every event type.
+###
+### Only normalScore is capped by maxScore: totalScore includes extra
+### credit, and a curve can push curvedTotalScore past the maximum too.
+
+EVENT_RULES = {
+    'Event': [required('actor'), required('action'), required('object'),
+        required('eventTime')],
+}
+
+ENTITY_RULES = {
+    'Entity': [required('id')],
+    'Attempt': [required('actor'), required('assignable')],
+    'Response': [required('actor'), required('attempt')],
+    'FillinBlankResponse': [is_string_list('values')],
+    'MultipleChoiceResponse': [is_string('values')],
+    'MultipleResponseResponse': [is_string_list('values')],
+    'SelectTextResponse': [is_string_list('values')],
+    'TrueFalseResponse': [is_string('values')],
+    'Result': [required('actor'), score_in_range('normalScore'),
+        non_negative_score('extraCreditScore'), non_negative_score('penaltyScore'),
+        non_negative_score('totalScore'), non_negative_score('curvedTotalScore')],
+}
+
+## event properties whose entities are validated too
+NESTED_ENTITIES = ('object', 'generated')
+
+
+class Validator(object):
+    def __init__(self, event_rules=EVENT_RULES, entity_rules=ENTITY_RULES,
+        classes=()):
+        self.event_rules = event_rules
+        self.entity_rules = entity_rules
+        self._compiled = {}
+        for cls in classes:
+            self._checks_for(cls)
+
+    def _checks_for(self, cls):
+        checks = self._compiled.get(cls)
+        if checks is None:
+            names = [c.__name__ for c in reversed(cls.__mro__)]
+            rules = self.event_rules if 'Event' in names else self.entity_rules
+            checks = tuple(check for name in names for check in rules.get(name, ()))
+            self._compiled[cls] = checks
+        return checks
+
+    def errors(self, event):
+        errors = [e for e in (check(event) for check in self._checks_for(type(event))) if e]
+        for prop in NESTED_ENTITIES:
+            entity = getattr(event, prop, None)
+            if entity is None or isinstance(entity, string_types):
+                continue
+            for check in self._checks_for(type(entity)):
+                error = check(entity)
+                if error:
+                    errors.append('{0!s}: {1!s}'.format(prop, error))
+        return errors
+
+    def validate_batch(self, events, dead_letter=None):
+        """Split events into (valid, invalid); invalid is a list of
+        (event, errors) pairs, also written to dead_letter if given."""
+        valid = []
+        invalid = []
+        for event in events:
+            errors = self.errors(event)
+            if errors:
+                invalid.append((event, errors))
+            else:
+                valid.append(event)
+        if invalid and dead_letter is not None:
+            dead_letter.write(invalid)
+        return valid, invalid
+
+
+class DeadLetterFile(object):
+    """Appends rejected events to a file, one JSON object per line."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, invalid):
+        lines = []
+        for event, errors in invalid:
+            try:
+                payload = event.as_json()
+            except Exception:
+                payload = json.dumps(repr(event))
+            lines.append('{{"errors": {0!s}, "event": {1!s}}}\n'.format(
+                json.dumps(errors), payload))
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.writelines(lines)
+
+
+def build_validator():
+    """Compile the rules for every caliper event/entity class up front."""
+    import caliper.entities
+    import caliper.events
+    classes = [cls for module in (caliper.events, caliper.entities)
+        for cls in vars(module).values() if isinstance(cls, type)]
+    return Validator(classes=classes)